@@ -1,16 +1,17 @@
 """
 main file for the application
 """
-from threading import Thread
+from archiver import UNKNOWN_TOTAL, Archiver
 
-from archiver import Archiver
 
+def progress(current, bytes, total, total_bytes):
+    if total == UNKNOWN_TOTAL:
+        print(f"Progress: {current} files, {bytes} bytes")
+    else:
+        print(f"Progress: {current}/{total} files, {bytes}/{total_bytes} bytes")
 
-def progress(current, bytes, total):
-    print(f"Progress: {current}/{total}")
-
-def completed(total, elapsed):
-    print(f"Completed: {total} files in {elapsed:.2f} seconds")
+def completed(total, total_bytes, elapsed):
+    print(f"Completed: {total} files ({total_bytes} bytes) in {elapsed:.2f} seconds")
 
 
 def main():
@@ -2,10 +2,479 @@
 This module contains the Archiver class, which is responsible for archiving files and directories using tarfile module.
 """
 
+import collections
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+import contextlib
+import copy
+from functools import lru_cache
+import gzip
+import io
+import itertools
+import json
+import os
 from pathlib import Path
+import queue
+import stat
+import sys
 import tarfile
+import threading
 import time
-from typing import Callable, Optional, Union
+from typing import BinaryIO, Callable, Iterator, Optional, Tuple, Union
+
+try:
+    import grp
+    import pwd
+except ImportError:
+    grp = pwd = None
+
+try:
+    from isal import igzip, isal_zlib
+except ImportError:
+    igzip = isal_zlib = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Archive file suffix and default compression level for each supported compression
+COMPRESSION_SUFFIXES = {"none": ".tar", "zstd": ".tar.zst", "gzip": ".tar.gz"}
+DEFAULT_LEVELS = {"none": None, "zstd": 3, "gzip": 6}
+
+# Directories with more entries than this are walked in directory order instead of inode order
+MAX_SORTED_ENTRIES = 65536
+
+# Reported as the progress totals until the single walk of the source has finished
+UNKNOWN_TOTAL = -1
+
+# Most entries submitted to the readers ahead of the writer, in walk order
+PENDING_READS = 32
+# Files up to this size are read into memory by the readers; larger ones are streamed by the
+# writer, with os.sendfile for uncompressed archives
+MAX_BUFFERED_SIZE = 1 << 20
+# Buffer between the tar file and the destination, and tarfile's own copy/stream block size
+WRITE_BUFFER_SIZE = 1 << 20
+TAR_BUFFER_SIZE = 64 << 10
+# Uncompressed bytes per zstd frame; each frame can be decompressed independently
+ZSTD_FRAME_SIZE = 32 << 20
+# Like shutil, only use sendfile between regular files on Linux; elsewhere it may require a socket
+_USE_SENDFILE = hasattr(os, "sendfile") and sys.platform.startswith("linux")
+# Size of the uncompressed shards gzipped in parallel, each becoming one gzip member
+GZIP_SHARD_SIZE = 16 << 20
+# Most shards being compressed or waiting to be written at once, bounding memory to about 128 MiB
+GZIP_MAX_PENDING = 8
+
+
+def _scandir_recursive(path: Union[str, Path]) -> Iterator[os.DirEntry]:
+    """
+    Yield a DirEntry for every entry below path, each directory before its contents.
+
+    Unlike Path.rglob, the entries come straight from os.scandir, so their type
+    and (on most platforms) stat information is cached from the directory read.
+    Each directory's entries are yielded in inode order, which on most file
+    systems is close to on-disk order and turns the reads that follow into
+    mostly sequential I/O. Very large directories are left unsorted to bound
+    memory.
+
+    :param path: The directory to walk.
+    :type path: str or Path
+    """
+    with os.scandir(path) as it:
+        entries = list(itertools.islice(it, MAX_SORTED_ENTRIES + 1))
+        if len(entries) <= MAX_SORTED_ENTRIES:
+            entries.sort(key=os.DirEntry.inode)
+        for entry in itertools.chain(entries, it):
+            yield entry
+            if entry.is_dir(follow_symlinks=False):
+                yield from _scandir_recursive(entry.path)
+
+
+@lru_cache(maxsize=1024)
+def _resolve(path: str) -> Path:
+    """
+    Resolve an absolute path, caching the result for Archivers created for the same paths.
+
+    Resolving walks every symlink with lstat calls. The cache assumes the symlinks
+    along the path do not change while the process runs.
+
+    :param path: The absolute path to resolve. It must not be normalised first, since
+        ".." after a symlink is only meaningful once the symlink is followed.
+    :type path: str
+    :return: The resolved path.
+    :rtype: Path
+    """
+    return Path(path).resolve()
+
+
+def _advise(fd: int, *advice: int):
+    """
+    Pass page cache hints for the whole of fd to the kernel, where posix_fadvise exists.
+
+    :param fd: The file descriptor the hints apply to.
+    :type fd: int
+    :param advice: The POSIX_FADV_* values to apply, in order.
+    :type advice: int
+    """
+    if not hasattr(os, "posix_fadvise"):
+        return
+    try:
+        for value in advice:
+            os.posix_fadvise(fd, 0, 0, value)
+    except OSError:
+        # Hints are best effort and never worth failing the archive for
+        pass
+
+
+def _open_source(path: str) -> BinaryIO:
+    """
+    Open a source file for a single sequential read.
+
+    :param path: The path of the file.
+    :type path: str
+    :return: The file opened in binary mode.
+    :rtype: file
+    """
+    f = open(path, "rb")
+    if hasattr(os, "posix_fadvise"):
+        _advise(f.fileno(), os.POSIX_FADV_SEQUENTIAL, os.POSIX_FADV_WILLNEED)
+    return f
+
+
+def _read_source(path: str, size: int) -> bytes:
+    """
+    Read a whole source file with bare open/read/close calls.
+
+    Skipping the buffered file object saves the fstat, isatty ioctl and lseek
+    calls open() makes, which dominate the cost of reading small files.
+
+    :param path: The path of the file.
+    :type path: str
+    :param size: The size of the file.
+    :type size: int
+    :return: The contents of the file, shorter than size only if the file ended early.
+    :rtype: bytes
+    """
+    fd = os.open(path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+    try:
+        if hasattr(os, "posix_fadvise"):
+            _advise(fd, os.POSIX_FADV_SEQUENTIAL, os.POSIX_FADV_WILLNEED)
+        data = os.read(fd, size)
+        # read() may return less than asked on network and FUSE file systems
+        if 0 < len(data) < size:
+            chunks = [data]
+            remaining = size - len(data)
+            while remaining > 0 and (chunk := os.read(fd, remaining)):
+                chunks.append(chunk)
+                remaining -= len(chunk)
+            data = b"".join(chunks)
+        if hasattr(os, "posix_fadvise"):
+            _advise(fd, os.POSIX_FADV_DONTNEED)
+        return data
+    finally:
+        os.close(fd)
+
+
+def _close_source(f: BinaryIO):
+    """
+    Close a source file and drop its pages from the page cache, since it will not be read again.
+
+    :param f: The file opened by _open_source, or an in-memory copy of it.
+    :type f: file
+    """
+    if hasattr(os, "posix_fadvise") and not isinstance(f, io.BytesIO):
+        _advise(f.fileno(), os.POSIX_FADV_DONTNEED)
+    f.close()
+
+
+@lru_cache(maxsize=None)
+def _user_name(uid: int) -> str:
+    """
+    Return the name of the user with the given id, or an empty string if it is unknown.
+    """
+    try:
+        return pwd.getpwuid(uid)[0] if pwd else ""
+    except KeyError:
+        return ""
+
+
+@lru_cache(maxsize=None)
+def _group_name(gid: int) -> str:
+    """
+    Return the name of the group with the given id, or an empty string if it is unknown.
+    """
+    try:
+        return grp.getgrgid(gid)[0] if grp else ""
+    except KeyError:
+        return ""
+
+
+def _tarinfo_from_stat(
+    path: str, arcname: str, st: os.stat_result
+) -> Optional[tarfile.TarInfo]:
+    """
+    Build a TarInfo from an existing lstat result, like TarFile.gettarinfo without the extra lstat.
+
+    Hard links are detected by the writer, which sees the members in order.
+
+    :param path: The path of the file on disk, used to read symlink targets.
+    :type path: str
+    :param arcname: The name of the member in the archive.
+    :type arcname: str
+    :param st: The lstat result of the file.
+    :type st: os.stat_result
+    :return: The TarInfo, or None for file types tar cannot store (sockets).
+    :rtype: tarfile.TarInfo
+    """
+    if os.sep != "/":
+        arcname = arcname.replace(os.sep, "/")
+    info = tarfile.TarInfo(arcname)
+    mode = st.st_mode
+    if stat.S_ISREG(mode):
+        info.type = tarfile.REGTYPE
+        info.size = st.st_size
+    elif stat.S_ISDIR(mode):
+        info.type = tarfile.DIRTYPE
+    elif stat.S_ISLNK(mode):
+        info.type = tarfile.SYMTYPE
+        info.linkname = os.readlink(path)
+    elif stat.S_ISFIFO(mode):
+        info.type = tarfile.FIFOTYPE
+    elif stat.S_ISCHR(mode) or stat.S_ISBLK(mode):
+        info.type = tarfile.CHRTYPE if stat.S_ISCHR(mode) else tarfile.BLKTYPE
+        info.devmajor = os.major(st.st_rdev)
+        info.devminor = os.minor(st.st_rdev)
+    else:
+        return None
+
+    info.mode = stat.S_IMODE(mode)
+    info.uid = st.st_uid
+    info.gid = st.st_gid
+    info.mtime = st.st_mtime
+    info.uname = _user_name(st.st_uid)
+    info.gname = _group_name(st.st_gid)
+    return info
+
+
+def _gzip_compress(data: bytearray, level: int) -> bytes:
+    """
+    Compress data into a complete gzip member, with ISA-L where it supports the level.
+
+    :param data: The data to compress.
+    :type data: bytearray
+    :param level: The compression level.
+    :type level: int
+    :return: The gzip member.
+    :rtype: bytes
+    """
+    if igzip is not None and level <= isal_zlib.ISAL_BEST_COMPRESSION:
+        return igzip.compress(data, compresslevel=level, mtime=0)
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+class _FramedZstdWriter:
+    """
+    Write-only file object that ends the zstd frame every ZSTD_FRAME_SIZE bytes of input.
+
+    A single stream_writer produces one frame however much data it is given, even
+    when compressing on several threads. Closing frames at regular intervals gives
+    readers independent frames to decompress in parallel.
+    """
+
+    def __init__(self, writer):
+        """
+        Initialize the writer.
+
+        :param writer: The zstandard stream writer the data is compressed with. It is closed with this object.
+        :type writer: zstandard.ZstdCompressionWriter
+        """
+        self.writer = writer
+        self._frame_bytes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, data: bytes) -> int:
+        """
+        Compress data, closing the current frame once it holds ZSTD_FRAME_SIZE bytes.
+
+        :param data: The data to write.
+        :type data: bytes
+        :return: The number of bytes written.
+        :rtype: int
+        """
+        self.writer.write(data)
+        self._frame_bytes += len(data)
+        if self._frame_bytes >= ZSTD_FRAME_SIZE:
+            self.writer.flush(zstandard.FLUSH_FRAME)
+            self._frame_bytes = 0
+        return len(data)
+
+    def close(self):
+        """
+        End the last frame and close the stream writer.
+        """
+        self.writer.close()
+
+
+class _ParallelGzipWriter:
+    """
+    Write-only file object that gzips fixed-size shards of its input on a thread pool.
+
+    Every shard is compressed into its own gzip member and the members are written
+    in order. Concatenated members form a valid gzip file, so the result reads like
+    any other .tar.gz. zlib and ISA-L release the GIL while compressing, so threads
+    scale without copying shards to other processes.
+    """
+
+    def __init__(self, fileobj: BinaryIO, level: int, workers: int):
+        """
+        Initialize the writer.
+
+        :param fileobj: The file the gzip members are written to. It is not closed.
+        :type fileobj: file
+        :param level: The compression level.
+        :type level: int
+        :param workers: The number of compression threads, capped at GZIP_MAX_PENDING.
+        :type workers: int
+        """
+        self.fileobj = fileobj
+        self.level = level
+        # More threads than pending shards would sit idle, however many cores there are
+        self._executor = ThreadPoolExecutor(max_workers=min(workers, GZIP_MAX_PENDING))
+        self._pending = collections.deque()
+        self._buffer = bytearray()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self._executor.shutdown(cancel_futures=True)
+
+    def write(self, data: bytes) -> int:
+        """
+        Buffer data, handing it to the pool whenever a full shard has accumulated.
+
+        :param data: The data to write.
+        :type data: bytes
+        :return: The number of bytes written.
+        :rtype: int
+        """
+        self._buffer += data
+        if len(self._buffer) >= GZIP_SHARD_SIZE:
+            self._submit()
+        return len(data)
+
+    def close(self):
+        """
+        Compress the last partial shard and write all outstanding members.
+        """
+        try:
+            if self._buffer:
+                self._submit()
+            while self._pending:
+                self.fileobj.write(self._pending.popleft().result())
+        finally:
+            self._executor.shutdown(cancel_futures=True)
+
+    def _submit(self):
+        """
+        Hand the buffered shard to the pool and write the members that are due.
+        """
+        self._pending.append(
+            self._executor.submit(_gzip_compress, self._buffer, self.level)
+        )
+        self._buffer = bytearray()
+        while len(self._pending) > GZIP_MAX_PENDING:
+            self.fileobj.write(self._pending.popleft().result())
+
+
+class _ArchiveTarFile(tarfile.TarFile):
+    """
+    TarFile that writes compact headers and copies file contents with os.sendfile.
+
+    Members get plain 512 byte USTAR headers, and a pax extended header only when
+    USTAR cannot represent them. Contents are copied by the kernel when both the
+    source and the archive are real files; anything else falls back to the stock
+    tarfile copy.
+    """
+
+    def addfile(self, tarinfo: tarfile.TarInfo, fileobj: Optional[BinaryIO] = None):
+        """
+        Add the TarInfo object to the archive, copying tarinfo.size bytes from fileobj.
+
+        :param tarinfo: The member to add.
+        :type tarinfo: tarfile.TarInfo
+        :param fileobj: The file the member's contents are read from.
+        :type fileobj: file
+        """
+        self._check("awx")
+        tarinfo = copy.copy(tarinfo)
+
+        try:
+            buf = tarinfo.tobuf(self.format, self.encoding, self.errors)
+        except ValueError:
+            # Long names and links, or sizes of 8 GiB and more, need pax headers
+            buf = tarinfo.tobuf(tarfile.PAX_FORMAT, self.encoding, self.errors)
+        self.fileobj.write(buf)
+        self.offset += len(buf)
+
+        # If there's data to follow, append it
+        if fileobj is not None:
+            if not self._sendfile(fileobj, tarinfo.size):
+                tarfile.copyfileobj(
+                    fileobj, self.fileobj, tarinfo.size, bufsize=self.copybufsize
+                )
+            blocks, remainder = divmod(tarinfo.size, tarfile.BLOCKSIZE)
+            if remainder > 0:
+                self.fileobj.write(tarfile.NUL * (tarfile.BLOCKSIZE - remainder))
+                blocks += 1
+            self.offset += blocks * tarfile.BLOCKSIZE
+
+        self.members.append(tarinfo)
+
+    def _sendfile(self, fileobj: BinaryIO, size: int) -> bool:
+        """
+        Copy size bytes from fileobj to the archive with os.sendfile, if both are real files.
+
+        :param fileobj: The file the contents are read from.
+        :type fileobj: file
+        :param size: The number of bytes to copy.
+        :type size: int
+        :return: False if sendfile cannot be used and nothing was copied.
+        :rtype: bool
+        """
+        if not _USE_SENDFILE:
+            return False
+        try:
+            in_fd = fileobj.fileno()
+            out_fd = self.fileobj.fileno()
+        except (AttributeError, io.UnsupportedOperation):
+            return False
+
+        # The header must reach the file before the kernel appends the contents
+        self.fileobj.flush()
+        offset = fileobj.tell()
+        first = True
+        while size > 0:
+            try:
+                sent = os.sendfile(out_fd, in_fd, offset, size)
+            except OSError:
+                # Some file systems reject sendfile (EINVAL, ENOSYS); nothing is sent yet
+                if first:
+                    return False
+                raise
+            first = False
+            if sent == 0:
+                raise OSError("unexpected end of data")
+            offset += sent
+            size -= sent
+        return True
 
 
 class Archiver:
@@ -19,6 +488,13 @@ class Archiver:
         destination: Optional[Union[str, Path]] = None,
         progress_callback: Optional[Callable[[int, int, int, int], None]] = None,
         completed_callback: Optional[Callable[[int, int, float], None]] = None,
+        compression: str = "none",
+        workers: Optional[int] = os.cpu_count(),
+        level: Optional[int] = None,
+        readers: int = 4,
+        progress_every: int = 256,
+        progress_bytes: int = 16 << 20,
+        shard_bytes: Optional[int] = None,
     ):
         """
         Initialize the Archiver object with source and destination paths.
@@ -33,35 +509,74 @@ class Archiver:
         :type files_added: int
         :param bytes_written: The total number of bytes written to the archive.
         :type bytes_written: int
-        :param total_files: The total number of files in the source directory.
+        :param total_files: The total number of files in the source directory, or UNKNOWN_TOTAL while the directory is still being walked.
         :type total_files: int
-        :param total_bytes: The total number of bytes in the source directory.
+        :param total_bytes: The total number of bytes in the source directory, or UNKNOWN_TOTAL while the directory is still being walked.
         :type total_bytes: int
-        :param completed_callback: A function that takes two arguments (total, elapsed) to report completion.
+        :param completed_callback: A function that takes three arguments (total_files, total_bytes, elapsed) to report completion.
         :type completed_callback: function
-        :param total_files: The total number of files in the source directory.
+        :param total_files: The total number of files added to the archive.
         :type total_files: int
-        :param total_bytes: The total number of bytes in the source directory.
+        :param total_bytes: The total number of bytes added to the archive.
         :type total_bytes: int
         :param elapsed: The total time taken to complete the archiving process in seconds.
         :type elapsed: float
+        :param compression: The compression applied to the archive: "none", "zstd" or "gzip".
+        :type compression: str
+        :param workers: The number of threads used to compress the archive.
+        :type workers: int
+        :param level: The compression level. Defaults to 3 for zstd and 6 for gzip. gzip levels of 3 or lower use ISA-L when python-isal is installed.
+        :type level: int
+        :param readers: The number of threads reading source files while the archive is written.
+        :type readers: int
+        :param progress_every: Report progress every this many files.
+        :type progress_every: int
+        :param progress_bytes: Also report progress once this many bytes were added since the last report.
+        :type progress_bytes: int
+        :param shard_bytes: If set, split the archive into independent shards of about this many uncompressed bytes (e.g. 512 MiB), named like archive.part-0000.tar.zst, plus an archive.index.json listing each shard's file, members and uncompressed size. Files are never split across shards.
+        :type shard_bytes: int
         """
 
+        # Validate the compression settings
+        if compression not in COMPRESSION_SUFFIXES:
+            raise ValueError(
+                f"Compression must be one of {', '.join(COMPRESSION_SUFFIXES)}."
+            )
+        elif compression == "zstd" and zstandard is None:
+            raise ImportError("zstd compression requires the zstandard package.")
+        self.compression = compression
+        self.workers = workers or 1
+        self.level = DEFAULT_LEVELS[compression] if level is None else level
+        if readers < 1:
+            raise ValueError("Readers must be at least 1.")
+        self.readers = readers
+        if progress_every < 1:
+            raise ValueError("Progress interval must be at least 1 file.")
+        self.progress_every = progress_every
+        self.progress_bytes = progress_bytes
+        if shard_bytes is not None and shard_bytes < 1:
+            raise ValueError("Shard size must be at least 1 byte.")
+        self.shard_bytes = shard_bytes
+
         # Validate the source and destination paths
-        if isinstance(source, str):
-            self.source = Path(source).resolve()
-        elif isinstance(source, Path):
-            self.source = source.resolve()
+        if isinstance(source, (str, Path)):
+            self.source = _resolve(str(Path(source).absolute()))
         else:
             raise TypeError("Source must be a string or Path object.")
 
-        # Check if the source file or directory exists
-        if not self.source.exists():
-            raise FileNotFoundError(f"File or directory not found: {self.source}")
-        elif destination is None:
-            self.destination = self.source.with_suffix(".tar")
+        # Check if the source file or directory exists, keeping the stat for archive()
+        try:
+            self._source_stat = os.stat(self.source)
+        except (FileNotFoundError, NotADirectoryError):
+            raise FileNotFoundError(
+                f"File or directory not found: {self.source}"
+            ) from None
+        if destination is None:
+            self.destination = self.source.with_suffix(
+                COMPRESSION_SUFFIXES[compression]
+            )
         else:
-            self.destination = Path(destination).resolve()
+            self.destination = _resolve(str(Path(destination).absolute()))
 
         # Validate the progress and completed callbacks
         if progress_callback and not callable(progress_callback):
@@ -74,10 +589,14 @@ class Archiver:
         else:
             self.completed_callback = completed_callback
 
+        # The source type is fixed, so archive() dispatches on this flag instead of a stat
+        self._source_is_dir = stat.S_ISDIR(self._source_stat.st_mode)
+
     def archive(self, progress_callback=None, completed_callback=None):
         """
         Archive the source file or directory to the destination path.
 
+        An empty source directory is reported as completed without creating the archive.
 
         :param progress_callback: A function that takes two arguments (current, total) to report progress.
         :type progress_callback: function
@@ -85,71 +604,419 @@ class Archiver:
         :type files_added: int
         :param bytes_written: The total number of bytes written to the archive.
         :type bytes_written: int
-        :param total_files: The total number of files in the source directory.
+        :param total_files: The total number of files in the source directory, or UNKNOWN_TOTAL while the directory is still being walked.
         :type total_files: int
-        :param total_bytes: The total number of bytes in the source directory.
+        :param total_bytes: The total number of bytes in the source directory, or UNKNOWN_TOTAL while the directory is still being walked.
         :type total_bytes: int
-        :param completed_callback: A function that takes two arguments (total, elapsed) to report completion.
+        :param completed_callback: A function that takes three arguments (total_files, total_bytes, elapsed) to report completion.
         :type completed_callback: function
-        :param total_files: The total number of files in the source directory.
+        :param total_files: The total number of files added to the archive.
         :type total_files: int
-        :param total_bytes: The total number of bytes in the source directory.
+        :param total_bytes: The total number of bytes added to the archive.
         :type total_bytes: int
         :param elapsed: The total time taken to complete the archiving process in seconds.
         :type elapsed: float
         """
+        if self._source_is_dir:
+            return self._archive_dir(progress_callback, completed_callback)
+        return self._archive_file(progress_callback, completed_callback)
+
+    def _archive_dir(self, progress_callback=None, completed_callback=None):
+        """
+        Archive a source directory; see archive().
+        """
         # If progress_callback and completed_callback are provided, use them; otherwise, use the ones provided during initialization
         progress_callback = progress_callback or self.progress_callback
         completed_callback = completed_callback or self.completed_callback
 
+        # An empty directory has nothing to archive, so don't create the tar file at all
+        with os.scandir(self.source) as it:
+            empty = next(it, None) is None
+        if empty:
+            if completed_callback:
+                completed_callback(0, 0, 0.0)
+            return
+
         start = time.time()
 
-        # Determine the total number of files to be archived
-        total_files = self.total_files
-        total_bytes = self.total_bytes
+        # The tree is walked once, so the totals are only known when archiving finishes
         files_added = 0
         bytes_written = 0
+        reported_bytes = 0
 
-        with tarfile.open(self.destination, "w") as tar:
-            # If source is a directory, add files individually and track progress
-            if self.source.is_dir():
-                for file in self.source.rglob("*"):
-                    tar.add(file, arcname=file.relative_to(self.source.parent))
-                    files_added += 1
-                    bytes_written += file.stat().st_size
-                    # Call the progress callback if provided
-                    if progress_callback:
-                        progress_callback(files_added, bytes_written, total_files, total_bytes)
-            else:
-                # If source is a single file, add it directly
-                tar.add(self.source, arcname=self.source.name)
-                files_added = 1
-                # Call the progress callback if provided
-                if progress_callback:
+        # Each shard records its size, and its members when sharding, for the index
+        shards = []
+        # Arcname of the first member seen for each multiply linked file, per shard
+        links = {}
+
+        # Add files through the walk/read/write pipeline
+        with contextlib.ExitStack() as stack:
+            pipeline = stack.enter_context(contextlib.closing(self._pipeline()))
+            shard_stack = stack.enter_context(contextlib.ExitStack())
+            tar = self._open_shard(shard_stack, shards)
+            for info, fileobj, st in pipeline:
+                # Start a new shard at a file boundary once the current one is full
+                if self.shard_bytes and tar.offset >= self.shard_bytes:
+                    shards[-1]["uncompressed_bytes"] = tar.offset
+                    shard_stack.close()
+                    tar = self._open_shard(shard_stack, shards)
+                    # Shards are extracted independently, so links may only point within one
+                    links.clear()
+                # Store later names of a hard linked file as links to the first one
+                if info.isreg() and st.st_nlink > 1:
+                    target = links.setdefault((st.st_dev, st.st_ino), info.name)
+                    if target != info.name:
+                        if fileobj is not None:
+                            _close_source(fileobj)
+                            fileobj = None
+                        info.type = tarfile.LNKTYPE
+                        info.linkname = target
+                        info.size = 0
+                try:
+                    tar.addfile(info, fileobj)
+                finally:
+                    if fileobj is not None:
+                        _close_source(fileobj)
+                if self.shard_bytes:
+                    shards[-1]["members"].append(info.name)
+                files_added += 1
+                bytes_written += info.size
+                # Call the progress callback if provided, throttled by file count and bytes
+                if progress_callback and (
+                    files_added % self.progress_every == 0
+                    or bytes_written - reported_bytes >= self.progress_bytes
+                ):
                     progress_callback(
-                        files_added, bytes_written, total_files, total_bytes
+                        files_added, bytes_written, UNKNOWN_TOTAL, UNKNOWN_TOTAL
                     )
+                    reported_bytes = bytes_written
+            shards[-1]["uncompressed_bytes"] = tar.offset
+
+        self._finish(
+            shards,
+            files_added,
+            bytes_written,
+            time.time() - start,
+            progress_callback,
+            completed_callback,
+        )
+
+    def _archive_file(self, progress_callback=None, completed_callback=None):
+        """
+        Archive a single source file; see archive().
+        """
+        # If progress_callback and completed_callback are provided, use them; otherwise, use the ones provided during initialization
+        progress_callback = progress_callback or self.progress_callback
+        completed_callback = completed_callback or self.completed_callback
+
+        start = time.time()
+
+        shards = []
+        with contextlib.ExitStack() as stack:
+            tar = self._open_shard(stack, shards)
+            tar.add(self.source, arcname=self.source.name)
+            if self.shard_bytes:
+                shards[-1]["members"].append(self.source.name)
+            shards[-1]["uncompressed_bytes"] = tar.offset
+
+        self._finish(
+            shards,
+            1,
+            self._source_stat.st_size,
+            time.time() - start,
+            progress_callback,
+            completed_callback,
+        )
+
+    def _finish(
+        self,
+        shards: list,
+        files_added: int,
+        bytes_written: int,
+        elapsed: float,
+        progress_callback=None,
+        completed_callback=None,
+    ):
+        """
+        Write the shard index if sharding, and report the final progress and completion.
+
+        :param shards: The index entries of the shards written.
+        :type shards: list
+        :param files_added: The number of files added to the archive.
+        :type files_added: int
+        :param bytes_written: The total number of bytes added to the archive.
+        :type bytes_written: int
+        :param elapsed: The time taken to write the archive in seconds.
+        :type elapsed: float
+        :param progress_callback: The resolved progress callback, if any.
+        :type progress_callback: function
+        :param completed_callback: The resolved completed callback, if any.
+        :type completed_callback: function
+        """
+        if self.shard_bytes:
+            with open(self._index_path(), "w", encoding="utf-8") as index:
+                json.dump(shards, index, indent=2)
 
-        end = time.time()
+        # Always report the final progress once the archive is closed
+        if progress_callback:
+            progress_callback(files_added, bytes_written, files_added, bytes_written)
 
         # Call the completed callback if provided
         if completed_callback:
-            completed_callback(total_files, total_bytes, end - start)
+            completed_callback(files_added, bytes_written, elapsed)
+
+    def archive_async(
+        self,
+        executor: Optional[Executor] = None,
+        progress_callback=None,
+        completed_callback=None,
+    ) -> Future:
+        """
+        Archive the source in the background and return immediately.
+
+        The callbacks are called from the background thread.
+
+        :param executor: The executor to run the archive on. If not provided, a single use thread is started.
+        :type executor: concurrent.futures.Executor
+        :param progress_callback: Passed on to archive().
+        :type progress_callback: function
+        :param completed_callback: Passed on to archive().
+        :type completed_callback: function
+        :return: A future that resolves when the archive is complete, or raises its error.
+        :rtype: concurrent.futures.Future
+        """
+        if executor is not None:
+            return executor.submit(self.archive, progress_callback, completed_callback)
+
+        executor = ThreadPoolExecutor(max_workers=1)
+        future = executor.submit(self.archive, progress_callback, completed_callback)
+        # Let the thread exit once the archive is done instead of waiting for it here
+        executor.shutdown(wait=False)
+        return future
+
+    def _pipeline(self) -> Iterator[Tuple[tarfile.TarInfo, Optional[BinaryIO], os.stat_result]]:
+        """
+        Walk and read the source directory on background threads.
+
+        A walker thread submits every entry to a pool of reader threads, which
+        build the TarInfo and read the file contents, and queues the resulting
+        futures in walk order. The calling thread consumes the futures in that
+        same order and stays the only one writing to the tar file, so the
+        member order is reproducible however the reads finish.
+
+        :return: Tuples of (tarinfo, fileobj, lstat result) in walk order. The caller must close fileobj and the generator.
+        :rtype: Iterator[Tuple[tarfile.TarInfo, Optional[BinaryIO], os.stat_result]]
+        """
+        futures = queue.Queue(maxsize=PENDING_READS)
+        stop = threading.Event()
+        executor = ThreadPoolExecutor(max_workers=self.readers)
+        threading.Thread(
+            target=self._walk, args=(executor, futures, stop), daemon=True
+        ).start()
+
+        future = None
+        try:
+            while (future := futures.get()) is not None:
+                if isinstance(future, BaseException):
+                    raise future
+                item = future.result()
+                if item is not None:
+                    yield item
+        finally:
+            # On error or early exit, drain so the walker never blocks, and close unwritten files
+            stop.set()
+            while future is not None and (future := futures.get()) is not None:
+                if isinstance(future, BaseException) or future.cancel():
+                    continue
+                if future.exception() is None and future.result() is not None:
+                    fileobj = future.result()[1]
+                    if fileobj is not None:
+                        _close_source(fileobj)
+            executor.shutdown()
+
+    def _walk(
+        self, executor: ThreadPoolExecutor, futures: queue.Queue, stop: threading.Event
+    ):
+        """
+        Walk the source directory, submitting each entry to the readers in walk order.
+
+        :param executor: The pool of reader threads.
+        :type executor: concurrent.futures.ThreadPoolExecutor
+        :param futures: The queue the futures and any walk error are put on, followed by None.
+        :type futures: queue.Queue
+        :param stop: Set when archiving has failed and the walk should stop.
+        :type stop: threading.Event
+        """
+        try:
+            for entry in _scandir_recursive(self.source):
+                if stop.is_set():
+                    break
+                # Never add the archive to itself
+                if not self._is_output(entry.path):
+                    futures.put(executor.submit(self._read, entry))
+        except BaseException as exc:
+            futures.put(exc)
+        finally:
+            futures.put(None)
+
+    def _read(
+        self, entry: os.DirEntry
+    ) -> Optional[Tuple[tarfile.TarInfo, Optional[BinaryIO], os.stat_result]]:
+        """
+        Turn an entry into a (tarinfo, fileobj, lstat result) item for the writer.
+
+        Each entry is stat'ed once and the TarInfo is built from that result.
+        Directories and other non-regular entries carry no file object. Small
+        files are read into memory; larger ones are passed on as open file
+        handles to cap the memory held by pending reads.
+
+        :param entry: The entry to read.
+        :type entry: os.DirEntry
+        :return: The item, or None for entries tar cannot store.
+        :rtype: Tuple[tarfile.TarInfo, Optional[BinaryIO], os.stat_result]
+        """
+        # Entries are below the source, so the arcname is the path minus the parent prefix
+        prefix_length = len(os.path.join(str(self.source.parent), ""))
+        st = entry.stat(follow_symlinks=False)
+        info = _tarinfo_from_stat(entry.path, entry.path[prefix_length:], st)
+        if info is None:
+            return None
+        fileobj = None
+        if info.isreg():
+            if info.size <= MAX_BUFFERED_SIZE:
+                fileobj = io.BytesIO(_read_source(entry.path, info.size))
+            else:
+                fileobj = _open_source(entry.path)
+        return info, fileobj, st
+
+    def _shard_stem(self) -> str:
+        """
+        Return the destination file name without its archive suffix.
+        """
+        suffix = COMPRESSION_SUFFIXES[self.compression]
+        name = self.destination.name
+        return name[: -len(suffix)] if name.endswith(suffix) else self.destination.stem
+
+    def _shard_path(self, index: int) -> Path:
+        """
+        Return the path of a shard, e.g. archive.part-0000.tar.zst, or the destination when not sharding.
+
+        :param index: The number of the shard.
+        :type index: int
+        :return: The path the shard is written to.
+        :rtype: Path
+        """
+        if not self.shard_bytes:
+            return self.destination
+        suffix = COMPRESSION_SUFFIXES[self.compression]
+        return self.destination.with_name(f"{self._shard_stem()}.part-{index:04d}{suffix}")
 
-    @property
-    def total_files(self):
+    def _index_path(self) -> Path:
         """
-        Return the total number of files in the source directory.
+        Return the path of the shard index, e.g. archive.index.json.
         """
-        if self.source.is_dir():
-            return sum(1 for _ in self.source.rglob("*"))
-        return 1
+        return self.destination.with_name(f"{self._shard_stem()}.index.json")
 
-    @property
-    def total_bytes(self):
+    def _is_output(self, path: str) -> bool:
         """
-        Return the total number of bytes in the source directory.
+        Return whether path is one of the files this archiver writes.
+
+        :param path: The path to check.
+        :type path: str
+        :rtype: bool
+        """
+        if not self.shard_bytes:
+            return path == str(self.destination)
+        directory, name = os.path.split(path)
+        stem = self._shard_stem()
+        return directory == str(self.destination.parent) and (
+            name.startswith(f"{stem}.part-") or name == f"{stem}.index.json"
+        )
+
+    def _open_shard(self, stack: contextlib.ExitStack, shards: list) -> tarfile.TarFile:
+        """
+        Open the next shard of the archive and record it in shards.
+
+        :param stack: The exit stack that closes the shard.
+        :type stack: contextlib.ExitStack
+        :param shards: The index entries of the shards opened so far.
+        :type shards: list
+        :return: The tar file of the new shard.
+        :rtype: tarfile.TarFile
+        """
+        path = self._shard_path(len(shards))
+        tar = self._open_tar(stack, path)
+        shards.append(
+            {
+                "shard_file": path.name,
+                "members": [],
+                "uncompressed_bytes": 0,
+            }
+        )
+        return tar
+
+    def _open_tar(self, stack: contextlib.ExitStack, path: Path) -> tarfile.TarFile:
+        """
+        Open the destination tar file, stacking the configured compressor under it.
+
+        Compressed archives are written in streaming mode ("w|"), so the tar file
+        never seeks back and the compressor sees one continuous stream. zstd
+        compresses on its own worker threads and a new frame is started every
+        ZSTD_FRAME_SIZE bytes so readers can decompress frames in parallel; gzip
+        is compressed in shards on worker threads and written as one gzip
+        member per shard.
+        The destination is written through a 1 MiB buffer so the 512 byte
+        headers and padding blocks do not each cost a write() call, and
+        uncompressed archives copy file contents with os.sendfile. Members use
+        USTAR headers unless they need pax, since the default pax format adds
+        an extended header to every file with a fractional mtime.
+
+        :param stack: The exit stack that closes the tar file and compressor.
+        :type stack: contextlib.ExitStack
+        :param path: The path of the tar file.
+        :type path: Path
+        :return: The tar file opened for writing.
+        :rtype: tarfile.TarFile
         """
-        if self.source.is_dir():
-            return sum(file.stat().st_size for file in self.source.rglob("*"))
-        return self.source.stat().st_size
+        raw = stack.enter_context(
+            open(path, "wb", buffering=WRITE_BUFFER_SIZE)
+        )
+        if self.compression == "none":
+            return stack.enter_context(
+                _ArchiveTarFile.open(
+                    fileobj=raw,
+                    mode="w",
+                    format=tarfile.USTAR_FORMAT,
+                    copybufsize=TAR_BUFFER_SIZE,
+                )
+            )
+
+        if self.compression == "zstd":
+            compressor = zstandard.ZstdCompressor(
+                level=self.level, threads=self.workers
+            )
+            fileobj = stack.enter_context(
+                _FramedZstdWriter(compressor.stream_writer(raw))
+            )
+        elif self.workers > 1:
+            fileobj = stack.enter_context(
+                _ParallelGzipWriter(raw, self.level, self.workers)
+            )
+        elif igzip is not None and self.level <= isal_zlib.ISAL_BEST_COMPRESSION:
+            # ISA-L's SIMD deflate only offers levels 0-3 and releases the GIL
+            fileobj = stack.enter_context(
+                igzip.IGzipFile(fileobj=raw, mode="wb", compresslevel=self.level)
+            )
+        else:
+            fileobj = stack.enter_context(
+                gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=self.level)
+            )
+        return stack.enter_context(
+            _ArchiveTarFile.open(
+                fileobj=fileobj,
+                mode="w|",
+                format=tarfile.USTAR_FORMAT,
+                bufsize=TAR_BUFFER_SIZE,
+                copybufsize=TAR_BUFFER_SIZE,
+            )
+        )